@@ -2,13 +2,13 @@
 
 import sys
 import traceback
-from typing import List
+from typing import Final, List
 
 from borderlands.bl2 import AppBL2
 from borderlands.bltps import AppTPS
 from borderlands.savefile import BaseApp
 
-MIN_PYTHON = (3, 9)
+MIN_PYTHON: Final = (3, 9)
 
 ERROR_TEMPLATE = """
 Something went wrong, but please ensure you have the latest
@@ -8,7 +8,7 @@ from borderlands.bl2_routines import get_reset_proc, get_valid_reset_option_valu
 from borderlands.bl2_skill_tree import make_bl2skills_link
 from borderlands.datautil.common import unwrap_float, wrap_float, unwrap_bytes, wrap_bytes
 from borderlands.datautil.data_types import PlayerDict
-from borderlands.datautil.protobuf import apply_structure
+from borderlands.datautil.protobuf import apply_compiled_structure
 from borderlands.savefile import BaseApp
 
 
@@ -242,7 +242,7 @@ class AppBL2(BaseApp):
             self.notice(line)
 
     def report_challenge_stats(self, player: PlayerDict) -> None:
-        json_data = apply_structure(player, self.save_structure)
+        json_data = apply_compiled_structure(player, self.compiled_save_structure)
         if 'stats' not in json_data:
             self.error('No "stats" field in decoded JSON')
             return
@@ -326,7 +326,7 @@ class AppBL2(BaseApp):
         self.notice('')
 
     def _print_skills_url(self, player: PlayerDict) -> None:
-        json_data = apply_structure(player, self.save_structure)
+        json_data = apply_compiled_structure(player, self.compiled_save_structure)
         url = make_bl2skills_link(json_data)
         self.notice('Link for character\'s skill tree representation:')
         self.notice(url)
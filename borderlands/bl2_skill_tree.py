@@ -1,71 +1,93 @@
-import re
 import sys
-from typing import List, Optional, Final
+from collections import defaultdict, deque
+from types import MappingProxyType
+from typing import Deque, Dict, List, Final
 
 from borderlands.bl2_skill_data import CHAR_SKILLS, SkillItem
 
-_MISNAME_FIXES: Final = {
-    'shockandaaagggghhh': 'shockandaaaggghhh',
-    'divergentlikeness': 'divergentlikness',
-    'yippiekiyay': 'yippeekiyay',
-    'alloutofbubblegum': 'outofbubblegum',
-    # Commando
-    'hardtokill': 'diehard',
-    'maglock': 'mag-lock',
-    # Zer0
-    'headsh0t': 'headshot',
-    '0ptics': 'optics',
-    'precisi0n': 'precision',
-    '0nesh0t0nekill': 'oneshotonekill',
-    'b0re': 'bore',
-    'vel0city': 'velocity',
-    'killc0nfirmed': 'killconfirmed',
-    'at0newiththegun': 'atonewiththegun',
-    'criticalascensi0n': 'criticalascention',
-    'c0unterstrike': 'counterstrike',
-    'risingsh0t': 'risingshot',
-    'unf0rseen': 'unforseen',
-    'tw0fang': 'twofang',
-    'deathbl0ss0m': 'deathblossom',
-    'killingbl0w': 'killingblow',
-    'ir0nhand': 'ironhand',
-    'f0ll0wthr0ugh': 'followthrough',
-    # psycho
-    'bloodtwitch': 'bloodytwitch',
-    'buzzaxebombardier': 'buzzaxebombadier',
-    'emptytherage': 'emptyrage',
-}
-_CHAR_NAME_FIXES: Final = {
-    'mercenary': 'gunzerker',
-    'soldier': 'commando',
-    'lilacplayerclass': 'psycho',
-}
+_MISNAME_FIXES: Final = MappingProxyType(
+    {
+        'shockandaaagggghhh': 'shockandaaaggghhh',
+        'divergentlikeness': 'divergentlikness',
+        'yippiekiyay': 'yippeekiyay',
+        'alloutofbubblegum': 'outofbubblegum',
+        # Commando
+        'hardtokill': 'diehard',
+        'maglock': 'mag-lock',
+        # Zer0
+        'headsh0t': 'headshot',
+        '0ptics': 'optics',
+        'precisi0n': 'precision',
+        '0nesh0t0nekill': 'oneshotonekill',
+        'b0re': 'bore',
+        'vel0city': 'velocity',
+        'killc0nfirmed': 'killconfirmed',
+        'at0newiththegun': 'atonewiththegun',
+        'criticalascensi0n': 'criticalascention',
+        'c0unterstrike': 'counterstrike',
+        'risingsh0t': 'risingshot',
+        'unf0rseen': 'unforseen',
+        'tw0fang': 'twofang',
+        'deathbl0ss0m': 'deathblossom',
+        'killingbl0w': 'killingblow',
+        'ir0nhand': 'ironhand',
+        'f0ll0wthr0ugh': 'followthrough',
+        # psycho
+        'bloodtwitch': 'bloodytwitch',
+        'buzzaxebombardier': 'buzzaxebombadier',
+        'emptytherage': 'emptyrage',
+    }
+)
+# Characters dropped from skill names before matching them against the save
+_SKILL_NAME_STRIP: Final = str.maketrans('', '', '\' -!",')
+_CHAR_NAME_FIXES: Final = MappingProxyType(
+    {
+        'mercenary': 'gunzerker',
+        'soldier': 'commando',
+        'lilacplayerclass': 'psycho',
+    }
+)
+# Skill record name -> the (encoded) suffix it has in save files
+_skill_suffixes: Dict[str, bytes] = {}
+
+
+def _skill_suffix(name: str) -> bytes:
+    suffix = _skill_suffixes.get(name)
+    if suffix is None:
+        clean_name = name.translate(_SKILL_NAME_STRIP).replace('%', 'percent').lower()
+        clean_name = _MISNAME_FIXES.get(clean_name, clean_name)
+        suffix = _skill_suffixes[name] = clean_name.encode()
+    return suffix
 
 
 def make_skills_string(skill_records: List[SkillItem], skill_data: List[dict]) -> str:
     values = []
-    data = list(skill_data)
+
+    # Index the save's skills by the last component of their name, so each
+    # skill record is a dict lookup rather than a scan over all skills.
+    # Skills with the same suffix are consumed in their original order.
+    suffix_index: Dict[bytes, Deque[int]] = defaultdict(deque)
+    for i, item in enumerate(skill_data):
+        _, dot, suffix = item['name'].lower().rpartition(b'.')
+        if dot:
+            suffix_index[suffix].append(i)
 
     prev_branch_name = ''
     for name, max_value in skill_records:
-        clean_name = re.sub(r'[\' \-!\",]', '', name).replace('%', 'percent').lower()
-        clean_name = _MISNAME_FIXES.get(clean_name, clean_name)
+        suffix = _skill_suffix(name)
+        clean_name = suffix.decode()
 
-        found_index: Optional[int] = None
-        for i, item in enumerate(data):
-            if item['name'].decode().lower().endswith('.' + clean_name):
-                found_index = i
-                break
-        if found_index is None:
+        indexes = suffix_index.get(suffix)
+        if not indexes:
             sys.exit('unable to find value for skill %r (%r)' % (name, clean_name))
-        value = data[found_index]['level']
-        skill_name = data[found_index]['name'].decode()
+        found_index = indexes.popleft()
+        value = skill_data[found_index]['level']
+        skill_name = skill_data[found_index]['name'].decode()
         branch_name, skill = skill_name.split('.')[-2:]
         if branch_name != prev_branch_name:
             print('[%s]' % branch_name)
             prev_branch_name = branch_name
         print('%d - %s' % (value, skill))
-        data.pop(found_index)
         if value < 0:
             sys.exit('%r/%r: negative value %d' % (name, clean_name, value))
         if value > max_value:
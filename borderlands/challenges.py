@@ -1,9 +1,12 @@
-import io
 import struct
-from typing import Tuple, Optional, Dict
+from typing import Tuple, Optional, Dict, Final
 
 from borderlands.datautil.errors import BorderlandsError
 
+# Challenge data header and records, keyed by endian
+_HEADER_STRUCTS: Final = {endian: struct.Struct(endian + 'IIH') for endian in '<>'}
+_CHALLENGE_STRUCTS: Final = {endian: struct.Struct(endian + 'HBIBI') for endian in '<>'}
+
 
 class ChallengeCategory:
     """
@@ -111,7 +114,7 @@ def unwrap_challenges(*, data: bytes, challenges: Dict[int, Challenge], endian:
 
     """
 
-    unknown, size_in_bytes, num_challenges = struct.unpack(endian + 'IIH', data[:10])
+    unknown, size_in_bytes, num_challenges = _HEADER_STRUCTS[endian].unpack_from(data)
     # Sanity check on size reported
     if (size_in_bytes + 8) != len(data):
         raise BorderlandsError(f'Challenge data reported as {size_in_bytes} bytes, but {len(data) - 8} bytes found')
@@ -122,22 +125,26 @@ def unwrap_challenges(*, data: bytes, challenges: Dict[int, Challenge], endian:
 
     # Now read them in
     challenges_result = []
-    for challenge in range(num_challenges):
-        idx = 10 + (challenge * 12)
-        challenge_dict = dict(
-            zip(
-                ['id', 'first_one', 'total_value', 'second_one', 'previous_value'],
-                struct.unpack(endian + 'HBIBI', data[idx : idx + 12]),
-            )
-        )
-        challenges_result.append(challenge_dict)
-
-        if challenge_dict['id'] in challenges:
-            info = challenges[challenge_dict['id']]
-            challenge_dict['_id_text'] = info.id_text
-            challenge_dict['_category'] = info.category.name
-            challenge_dict['_name'] = info.name
-            challenge_dict['_description'] = info.description
+    challenge_struct = _CHALLENGE_STRUCTS[endian]
+    with memoryview(data) as view:
+        for challenge_id, first_one, total_value, second_one, previous_value in challenge_struct.iter_unpack(view[10:]):
+            # These stay as dicts, since they're edited in place and
+            # written out as JSON objects
+            challenge_dict = {
+                'id': challenge_id,
+                'first_one': first_one,
+                'total_value': total_value,
+                'second_one': second_one,
+                'previous_value': previous_value,
+            }
+            challenges_result.append(challenge_dict)
+
+            info = challenges.get(challenge_id)
+            if info is not None:
+                challenge_dict['_id_text'] = info.id_text
+                challenge_dict['_category'] = info.category.name
+                challenge_dict['_name'] = info.name
+                challenge_dict['_description'] = info.description
 
     return {'unknown': unknown, 'challenges': challenges_result}
 
@@ -152,25 +159,19 @@ def wrap_challenges(*, data: dict, endian: str) -> bytes:
     Change the number of challenges at your own risk!
     """
 
-    b = io.BytesIO()
-    b.write(
-        struct.pack(
-            endian + 'IIH',
-            data['unknown'],
-            (len(data['challenges']) * 12) + 2,
-            len(data['challenges']),
-        )
-    )
     save_challenges = data['challenges']
-    for challenge in save_challenges:
-        b.write(
-            struct.pack(
-                endian + 'HBIBI',
-                challenge['id'],
-                challenge['first_one'],
-                challenge['total_value'],
-                challenge['second_one'],
-                challenge['previous_value'],
-            )
+    num_challenges = len(save_challenges)
+    challenge_struct = _CHALLENGE_STRUCTS[endian]
+    b = bytearray(10 + challenge_struct.size * num_challenges)
+    _HEADER_STRUCTS[endian].pack_into(b, 0, data['unknown'], (num_challenges * 12) + 2, num_challenges)
+    for i, challenge in enumerate(save_challenges):
+        challenge_struct.pack_into(
+            b,
+            10 + i * challenge_struct.size,
+            challenge['id'],
+            challenge['first_one'],
+            challenge['total_value'],
+            challenge['second_one'],
+            challenge['previous_value'],
         )
-    return b.getvalue()
+    return bytes(b)
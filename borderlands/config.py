@@ -1,6 +1,6 @@
 import argparse
 import os
-from typing import Union, Optional, List, Callable, Any, Dict
+from typing import Union, Optional, List, Callable, Any, Dict, Tuple
 
 
 def adjust_value(*, prev: Optional[Union[str, int]], min_value: int, max_value: int, label: str) -> Optional[int]:
@@ -66,7 +66,6 @@ class Config(argparse.Namespace):
 
     # Config options interpreted from the above
     endian = '<'
-    changes = False
 
     def finish(
         self,
@@ -140,27 +139,32 @@ class DictAction(argparse.Action):
         Actually setting a value.  Forces the attr into a dict if it isn't already.
         """
         arg_value = getattr(namespace, self.dest)
-        if not isinstance(arg_value, dict):
+        # Copy rather than update in place, since the default dict is shared
+        # by every Config (and the parser is reused between runs)
+        if isinstance(arg_value, dict):
+            arg_value = dict(arg_value)
+        else:
             arg_value = {}
         arg_value[values] = True
         setattr(namespace, self.dest, arg_value)
 
 
-def parse_args(
+# Parsers built by _build_parser, keyed by everything that went into them
+_parsers: Dict[tuple, argparse.ArgumentParser] = {}
+
+
+def _build_parser(
     *,
-    args: List[str],
     setup_currency_args: Callable[[argparse.ArgumentParser], None],
     setup_game_specific_args: Callable[[argparse.ArgumentParser], None],
     game_name: str,
     max_level: int,
-    min_backpack_size: int,
     max_backpack_size: int,
-    min_bank_size: int,
     max_bank_size: int,
-    unlock_choices: List[str],
-):
+    unlock_choices: Tuple[str, ...],
+) -> argparse.ArgumentParser:
     """
-    Parse our arguments.
+    Build our argument parser.
     """
 
     def non_empty_string(s):
@@ -179,9 +183,6 @@ def parse_args(
 
         raise argparse.ArgumentTypeError(f'positive integer value required: {result!r}')
 
-    # Set up our config object
-    config = Config()
-
     parser = argparse.ArgumentParser(
         description=f'Modify {game_name} Save Files',
         formatter_class=argparse.ArgumentDefaultsHelpFormatter,
@@ -312,7 +313,7 @@ def parse_args(
     parser.add_argument(
         '--unlock',
         action=DictAction,
-        choices=unlock_choices,
+        choices=list(unlock_choices),
         default={},
         help='Game features to unlock',
     )
@@ -366,6 +367,52 @@ def parse_args(
     # Additional game-specific arguments
     setup_game_specific_args(parser)
 
+    return parser
+
+
+def parse_args(
+    *,
+    args: List[str],
+    setup_currency_args: Callable[[argparse.ArgumentParser], None],
+    setup_game_specific_args: Callable[[argparse.ArgumentParser], None],
+    game_name: str,
+    max_level: int,
+    min_backpack_size: int,
+    max_backpack_size: int,
+    min_bank_size: int,
+    max_bank_size: int,
+    unlock_choices: List[str],
+):
+    """
+    Parse our arguments.  The parser itself is only built once for each
+    game, and reused when the app is instantiated again.
+    """
+
+    key = (
+        setup_currency_args,
+        setup_game_specific_args,
+        game_name,
+        max_level,
+        max_backpack_size,
+        max_bank_size,
+        tuple(unlock_choices),
+    )
+    parser = _parsers.get(key)
+    if parser is None:
+        parser = _build_parser(
+            setup_currency_args=setup_currency_args,
+            setup_game_specific_args=setup_game_specific_args,
+            game_name=game_name,
+            max_level=max_level,
+            max_backpack_size=max_backpack_size,
+            max_bank_size=max_bank_size,
+            unlock_choices=tuple(unlock_choices),
+        )
+        _parsers[key] = parser
+
+    # Set up our config object
+    config = Config()
+
     # Actually parse the args
     parser.parse_args(args, config)
 
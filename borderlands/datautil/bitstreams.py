@@ -1,4 +1,4 @@
-import copy
+from typing import Final
 
 
 class ReadBitstream:
@@ -37,53 +37,35 @@ class ReadBitstream:
 
 
 class WriteBitstream:
+    # Pending bits are flushed to `s` once at least this many have built up
+    FLUSH_BITS: Final = 256
+
     def __init__(self) -> None:
         self.s = bytearray()
-        self.byte = 0
-        self.i = 7
+        # Bits which haven't been written to `s` yet, most significant first
+        self.bits = 0
+        self.n_bits = 0
 
     def write_bit(self, b: int) -> None:
-        i = self.i
-        byte = self.byte | (b << i)
-        if i == 0:
-            self.s.append(byte)
-            self.byte = 0
-            self.i = 7
-        else:
-            self.byte = byte
-            self.i = i - 1
+        self.write_bits(b, 1)
 
     def write_bits(self, b: int, n: int) -> None:
-        s = self.s
-        byte = self.byte
-        i = self.i
-        while n >= (i + 1):
-            shift = n - (i + 1)
-            n = n - (i + 1)
-            byte = byte | (b >> shift)
-            b = b & ~(byte << shift)
-            s.append(byte)
-            byte = 0
-            i = 7
-        if n > 0:
-            byte = byte | (b << (i + 1 - n))
-            i = i - n
-        self.s = s
-        self.byte = byte
-        self.i = i
+        bits = (self.bits << n) | b
+        n_bits = self.n_bits + n
+        if n_bits >= self.FLUSH_BITS:
+            # Write out all the complete bytes
+            spare = n_bits & 7
+            self.s += (bits >> spare).to_bytes(n_bits >> 3, 'big')
+            bits &= (1 << spare) - 1
+            n_bits = spare
+        self.bits = bits
+        self.n_bits = n_bits
 
     def write_byte(self, b: int) -> None:
-        i = self.i
-        if i == 7:
-            self.s.append(b)
-        else:
-            self.s.append(self.byte | (b >> (7 - i)))
-            self.byte = (b << (i + 1)) & 0xFF
+        self.write_bits(b, 8)
 
     def getvalue(self) -> bytes:
-        if self.i != 7:
-            ret_s = copy.copy(self.s)
-            ret_s.append(self.byte)
-            return bytes(ret_s)
-        else:
-            return bytes(self.s)
+        # Any partial byte at the end is padded with zero bits
+        n_bits = self.n_bits
+        tail = (self.bits << (-n_bits & 7)).to_bytes((n_bits + 7) >> 3, 'big')
+        return b"".join((self.s, tail))
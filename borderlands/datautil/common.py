@@ -1,14 +1,22 @@
 import binascii
 import struct
-from typing import Any, Union, List, Dict
+from typing import Any, Union, List, Dict, Final, Tuple
+
+_U32: Final = struct.Struct("<I")
+_F32: Final = struct.Struct("<f")
+_ITEM_HEADER: Final = struct.Struct(">Bi")
+_ITEM_CHECKSUM: Final = struct.Struct(">H")
+# Item checksums are calculated over data padded with 0xFF to 40 bytes;
+# indexed by how many padding bytes are needed
+_ITEM_PADDING: Final = tuple(b"\xff" * n for n in range(34))
 
 
 def wrap_float(v: float) -> List[Union[int, Any]]:
-    return [5, struct.unpack("<I", struct.pack("<f", v))[0]]
+    return [5, _U32.unpack(_F32.pack(v))[0]]
 
 
 def unwrap_float(v: Any) -> float:
-    return struct.unpack("<f", struct.pack("<I", v))[0]
+    return _F32.unpack(_U32.pack(v))[0]
 
 
 def unwrap_bytes(value: bytes) -> list:
@@ -20,7 +28,10 @@ def wrap_bytes(value: list) -> bytes:
 
 
 def guess_wire_type(value: Any) -> int:
-    if isinstance(value, (str, bytes)):
+    # Decoded save values are always exact builtin types, so a plain type
+    # comparison is enough (and cheaper than isinstance)
+    value_type = type(value)
+    if value_type is bytes or value_type is str:
         return 2
     else:
         return 0
@@ -39,53 +50,83 @@ def invert_structure(structure: dict) -> dict:
     return inv
 
 
-def conv_binary_to_str(data: Any) -> Any:
+def bytes_to_latin1(value: Any) -> str:
     """
-    In Python 2, we can dump to a JSON object directly, but Python 3
-    doesn't like that some of the data is binary (since that's invalid in
-    JSON).  Python 2 would just cast those as strings automatically.
-    So this will loop through and convert everything that's binary
-    into a string.
+    `default` hook for json.dump(s): some of our data is binary, which
+    JSON can't represent, so those values are written out as latin1
+    strings instead.  This saves a separate pass over the whole structure
+    just to convert them beforehand.
     """
-    if isinstance(data, bytes):
-        return data.decode('latin1')
-    elif isinstance(data, dict):
-        return {k: conv_binary_to_str(v) for k, v in data.items()}
-    elif isinstance(data, list):
-        return [conv_binary_to_str(x) for x in data]
-    else:
-        return data
+    if isinstance(value, bytes):
+        return value.decode('latin1')
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
 
 
 def rotate_data_right(data: bytes, steps: int) -> bytes:
     steps = steps % len(data)
+    if steps == 0:
+        return data
     return data[-steps:] + data[:-steps]
 
 
 def rotate_data_left(data: bytes, steps: int) -> bytes:
     steps = steps % len(data)
+    if steps == 0:
+        return data
     return data[steps:] + data[:steps]
 
 
-def xor_data(data, key: int) -> bytes:
+# (size, key) -> keystream.  Items are decrypted when a save is read and
+# encrypted again with the same key when it's written, so most keystreams
+# get used at least twice in a run.
+_keystreams: Dict[Tuple[int, int], int] = {}
+_KEYSTREAM_CACHE_SIZE: Final = 4096
+
+
+def _keystream(size: int, key: int) -> int:
+    """
+    The first `size` bytes of the item keystream for `key`, as a
+    little-endian int so it can be XORed against a whole buffer at once.
+    """
     key = key & 0xFFFFFFFF
-    output = bytearray()
-    for c in data:
-        key = (key * 279470273) % 4294967291
-        output.append((c ^ key) & 0xFF)
-    return bytes(output)
+    keystream = _keystreams.get((size, key))
+    if keystream is not None:
+        return keystream
+    if len(_keystreams) >= _KEYSTREAM_CACHE_SIZE:
+        _keystreams.clear()
+
+    # The keystream recurrence is inherently sequential
+    stream = bytearray(size)
+    k = key
+    for i in range(size):
+        k = (k * 279470273) % 4294967291
+        stream[i] = k & 0xFF
+    keystream = _keystreams[(size, key)] = int.from_bytes(stream, 'little')
+    return keystream
+
+
+def xor_data(data, key: int) -> bytes:
+    size = len(data)
+    return (int.from_bytes(data, 'little') ^ _keystream(size, key)).to_bytes(size, 'little')
+
+
+def _item_checksum(header: bytes, item: bytes) -> bytes:
+    # Checksum is over header + 0xFFFF + item, padded with 0xFF to 40 bytes
+    h = binascii.crc32(header)
+    h = binascii.crc32(b"\xff\xff", h)
+    h = binascii.crc32(item, h)
+    h = binascii.crc32(_ITEM_PADDING[max(0, 33 - len(item))], h) & 0xFFFFFFFF
+    return _ITEM_CHECKSUM.pack(((h >> 16) ^ h) & 0xFFFF)
 
 
 def create_body(*, item: bytes, header: bytes, key: int) -> bytes:
-    padding = b"\xff" * (33 - len(item))
-    h = binascii.crc32(header + b"\xff\xff" + item + padding) & 0xFFFFFFFF
-    checksum = struct.pack(">H", ((h >> 16) ^ h) & 0xFFFF)
+    checksum = _item_checksum(header, item)
     body = xor_data(rotate_data_left(checksum + item, key & 31), key >> 5)
     return body
 
 
 def replace_raw_item_key(data: bytes, key: int) -> bytes:
-    old_key = struct.unpack(">i", data[1:5])[0]
+    old_key = _ITEM_HEADER.unpack_from(data)[1]
     item = rotate_data_right(xor_data(data[5:], old_key >> 5), old_key & 31)[2:]
-    header = struct.pack(">Bi", data[0], key)
+    header = _ITEM_HEADER.pack(data[0], key)
     return header + create_body(item=item, header=header, key=key)
@@ -1,4 +1,5 @@
 from bisect import insort
+from typing import Final, List, Optional, Tuple
 
 from borderlands.datautil.bitstreams import ReadBitstream, WriteBitstream
 
@@ -91,20 +92,76 @@ def invert_tree(node, code=0, bits=0) -> dict:
         return result
 
 
+# Number of bits huffman_decompress looks up at once.  Codes up to this
+# long are decoded with a single table lookup.
+DECODE_TABLE_BITS: Final = 11
+
+
+def build_decode_table(tree, table_bits: int = DECODE_TABLE_BITS) -> List[Tuple[Optional[int], int, object]]:
+    """
+    Builds a lookup table indexed by the next `table_bits` bits of the
+    stream.  Each entry is `(symbol, bits_used, None)` for codes which fit
+    in the table, or `(None, table_bits, subtree)` for longer codes, whose
+    remaining bits have to be read from `subtree` one at a time.
+    """
+    table: List[Tuple[Optional[int], int, object]] = [(None, 0, None)] * (1 << table_bits)
+
+    def fill(node, code: int, depth: int) -> None:
+        if isinstance(node[1], int):
+            shift = table_bits - depth
+            entry = (node[1], depth, None)
+            start = code << shift
+            table[start : start + (1 << shift)] = [entry] * (1 << shift)
+        elif depth == table_bits:
+            table[code] = (None, depth, node)
+        else:
+            fill(node[1][0], code << 1, depth + 1)
+            fill(node[1][1], (code << 1) | 1, depth + 1)
+
+    fill(tree, 0, 0)
+    return table
+
+
 def huffman_decompress(tree, bitstream, size) -> bytes:
-    output = bytearray()
-    while len(output) < size:
-        node = tree
-        while True:
-            b = bitstream.read_bit()
-            node = node[1][b]
-            if isinstance(node[1], int):
-                output.append(node[1])
-                break
+    table_bits = DECODE_TABLE_BITS
+    table = build_decode_table(tree, table_bits)
+    mask = (1 << table_bits) - 1
+    # Shift which leaves the wanted bits at the bottom of a 3-byte window
+    # starting at bit 0 of a byte
+    window_shift = 24 - table_bits
+
+    # Padded so the window never runs off the end of the data.  bitstream.s
+    # may be a memoryview, which join copies just once.
+    s = b"".join((bitstream.s, b"\x00\x00\x00"))
+    i = bitstream.i
+    output = bytearray(size)
+    for n in range(size):
+        p = i >> 3
+        window = ((s[p] << 16) | (s[p + 1] << 8) | s[p + 2]) >> (window_shift - (i & 7))
+        symbol, bits, node = table[window & mask]
+        i += bits
+        if symbol is None:
+            while True:
+                node = node[1][(s[i >> 3] >> (7 - (i & 7))) & 1]
+                i += 1
+                if isinstance(node[1], int):
+                    symbol = node[1]
+                    break
+        output[n] = symbol
+
+    if i > len(bitstream.s) * 8:
+        raise IndexError("Huffman data ends before all bytes were decoded")
+    bitstream.i = i
     return bytes(output)
 
 
 def huffman_compress(encoding, data, bitstream):
-    for c in data:
-        code, nbits = encoding[c]
-        bitstream.write_bits(code, nbits)
+    # Each byte's code as a string of '0'/'1' characters, so the codes for
+    # all of `data` can be joined together and written out in one go
+    codes = [''] * 256
+    for c, (code, nbits) in encoding.items():
+        if nbits:
+            codes[c] = format(code, f'0{nbits}b')
+    bits = ''.join(map(codes.__getitem__, data))
+    if bits:
+        bitstream.write_bits(int(bits, 2), len(bits))
@@ -1,6 +1,12 @@
 import sys
 from typing import Final, Optional, Tuple
 
+try:
+    import lzo
+except ImportError:
+    # python-lzo is optional; without it the pure-Python codec below is used
+    lzo = None
+
 CLZ_TABLE: Final = (
     32,
     0,
@@ -67,7 +73,7 @@ def read_xor32(src: bytearray, p1: int, p2: int) -> int:
     return v1 ^ v2
 
 
-def lzo1x_decompress(s: bytes) -> bytes:
+def _lzo1x_decompress_py(s: bytes) -> bytes:
     dst = bytearray()
     src = bytearray(s)
     ip = 5
@@ -239,7 +245,7 @@ def lzo1x_1_compress_core(*, src: bytearray, dst: bytearray, ti: int, ip_start:
             dst.append((m_off >> 6) & 0xFF)
 
 
-def lzo1x_1_compress(s: bytes) -> bytes:
+def _lzo1x_1_compress_py(s: bytes) -> bytes:
     src = bytearray(s)
     dst = bytearray()
 
@@ -285,3 +291,23 @@ def lzo1x_1_compress(s: bytes) -> bytes:
     dst.append(0)
 
     return bytes(dst)
+
+
+def lzo1x_decompress(s: bytes) -> bytes:
+    """
+    Decompress LZO1X data prefixed with the b'\\xf0' + big-endian length
+    header, which is also the header layout python-lzo expects.
+    """
+    if lzo is not None:
+        return lzo.decompress(s)
+    return _lzo1x_decompress_py(s)
+
+
+def lzo1x_1_compress(s: bytes) -> bytes:
+    """
+    LZO1X-1 compress, returning the data with the same five byte header
+    accepted by lzo1x_decompress.
+    """
+    if lzo is not None:
+        return lzo.compress(s, 1)
+    return _lzo1x_1_compress_py(s)
@@ -1,13 +1,67 @@
 import io
 import struct
-from typing import Any
+from typing import Any, Dict, Final, Optional, Tuple
 
 from borderlands.datautil.common import wrap_bytes, guess_wire_type
 from borderlands.datautil.data_types import PlayerDict
 from borderlands.datautil.errors import BorderlandsError
 
+_U64: Final = struct.Struct("<Q")
+_U32: Final = struct.Struct("<I")
+
+
+# Kinds of structure mappings, as resolved by compile_structure()
+_SCALAR: Final = 0  # plain "name" (or field number, for inverted structures)
+_PLAIN: Final = 1  # (name, repeated, None)
+_PACKED: Final = 2  # (name, repeated, wire_type)
+_WRAPPED: Final = 3  # (name, repeated, (unwrap, wrap))
+_MESSAGE: Final = 4  # (name, repeated, child_structure)
+_INVALID: Final = 5
+
+
+def compile_structure(s: dict, memo: Optional[Dict[int, dict]] = None) -> Dict[Any, tuple]:
+    """
+    Resolves every mapping in a (possibly inverted) save structure to a
+    `(kind, key, repeated, child)` tuple, so apply_structure/remove_structure
+    don't need to re-run the isinstance checks for each field they process.
+    For _MESSAGE mappings, `child` is the compiled child structure.  `memo`
+    compiles structures which appear more than once only the first time.
+
+    Code which uses the same structure over and over can compile it once
+    and pass the result to apply_compiled_structure/remove_compiled_structure.
+    """
+    if memo is None:
+        memo = {}
+    compiled = memo.get(id(s))
+    if compiled is not None:
+        return compiled
+
+    compiled = memo[id(s)] = {}
+    for k, mapping in s.items():
+        if isinstance(mapping, (str, int)):
+            compiled[k] = (_SCALAR, mapping, False, None)
+            continue
+        key, repeated, child = mapping
+        if child is None:
+            kind = _PLAIN
+        elif isinstance(child, int):
+            kind = _PACKED
+        elif isinstance(child, tuple):
+            kind = _WRAPPED
+        elif isinstance(child, dict):
+            kind = _MESSAGE
+            child = compile_structure(child, memo)
+        else:
+            kind = _INVALID
+        compiled[k] = (kind, key, repeated, child)
+    return compiled
+
 
 def remove_structure(data: dict, inv: dict) -> dict:
+    return remove_compiled_structure(data, compile_structure(inv))
+
+
+def remove_compiled_structure(data: dict, compiled: Dict[Any, tuple]) -> dict:
     result = {}
     result.update(data.get("_raw", {}))
     for k, value in data.items():
@@ -20,25 +74,24 @@ def remove_structure(data: dict, inv: dict) -> dict:
                     if wire_type == 2:
                         raw_values[idx][1] = wrap_bytes(v)
             continue
-        mapping = inv.get(k)
+        mapping = compiled.get(k)
         if mapping is None:
             raise BorderlandsError(f"Unknown key {k!r} in data")
-        elif isinstance(mapping, int):
-            result[mapping] = [[guess_wire_type(value), value]]
-            continue
-        key, repeated, child_inv = mapping
-        if child_inv is None:
+        kind, key, repeated, child_inv = mapping
+        if kind == _SCALAR:
+            result[key] = [[guess_wire_type(value), value]]
+        elif kind == _PLAIN:
             value = [value] if not repeated else value
             result[key] = [[guess_wire_type(v), v] for v in value]
-        elif isinstance(child_inv, int):
+        elif kind == _PACKED:
             if repeated:
-                b = io.BytesIO()
+                b = bytearray()
                 for v in value:
                     write_protobuf_value(b=b, wire_type=child_inv, value=v)
-                result[key] = [[2, b.getvalue()]]
+                result[key] = [[2, bytes(b)]]
             else:
                 result[key] = [[child_inv, value]]
-        elif isinstance(child_inv, tuple):
+        elif kind == _WRAPPED:
             if not repeated:
                 value = [value]
             values = []
@@ -48,151 +101,306 @@ def remove_structure(data: dict, inv: dict) -> dict:
                 else:
                     values.append([guess_wire_type(v), v])
             result[key] = values
-        elif isinstance(child_inv, dict):
+        elif kind == _MESSAGE:
             value = [value] if not repeated else value
             values = []
-            for d in [remove_structure(v, child_inv) for v in value]:
-                values.append([2, write_protobuf(d)])
+            # One scratch buffer is reused for every sub-message
+            scratch = bytearray()
+            for v in value:
+                write_protobuf_into(scratch, remove_compiled_structure(v, child_inv))
+                values.append([2, bytes(scratch)])
+                scratch.clear()
             result[key] = values
         else:
-            raise Exception(f"Invalid mapping {mapping!r} for {k!r}: {value!r}")
+            raise Exception(f"Invalid mapping {(key, repeated, child_inv)!r} for {k!r}: {value!r}")
     return result
 
 
-def read_varint(f: io.BytesIO) -> int:
-    value = 0
-    offset = 0
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    # Most varints in a save (tags, lengths, small ints) are a single byte
+    value = data[pos]
+    pos += 1
+    if value < 0x80:
+        return value, pos
+    value &= 0x7F
+    offset = 7
     while True:
-        b = ord(f.read(1))
+        b = data[pos]
+        pos += 1
         value |= (b & 0x7F) << offset
-        if (b & 0x80) == 0:
-            break
-        offset = offset + 7
+        if b < 0x80:
+            return value, pos
+        offset += 7
+
+
+def _read_packed_varints(data: bytes) -> list:
+    # Decodes varints back to back in a single pass over the bytes, rather
+    # than one _read_varint call per value
+    values = []
+    append = values.append
+    value = 0
+    offset = 0
+    for b in data:
+        if b < 0x80:
+            append(value | (b << offset))
+            value = 0
+            offset = 0
+        else:
+            value |= (b & 0x7F) << offset
+            offset += 7
+    if offset:
+        raise BorderlandsError("Packed varint data ends in the middle of a value")
+    return values
+
+
+def read_varint(f: io.BytesIO) -> int:
+    with f.getbuffer() as buf:
+        value, pos = _read_varint(buf, f.tell())
+    f.seek(pos)
     return value
 
 
-def write_varint(f: io.BytesIO, i: int) -> None:
+def write_varint(b: bytearray, i: int) -> None:
     while i > 0x7F:
-        f.write(bytes([0x80 | (i & 0x7F)]))
+        b.append(0x80 | (i & 0x7F))
         i = i >> 7
-    f.write(bytes([i]))
+    b.append(i)
 
 
-def read_protobuf_value(b: io.BytesIO, wire_type: int) -> Any:
+def _read_protobuf_value(data: bytes, pos: int, wire_type: int) -> Tuple[Any, int]:
     if wire_type == 0:
-        return read_varint(b)
+        return _read_varint(data, pos)
     elif wire_type == 1:
-        return struct.unpack("<Q", b.read(8))[0]
+        return _U64.unpack_from(data, pos)[0], pos + 8
     elif wire_type == 2:
-        length = read_varint(b)
-        return b.read(length)
+        length, pos = _read_varint(data, pos)
+        end = pos + length
+        return data[pos:end], end
     elif wire_type == 5:
-        return struct.unpack("<I", b.read(4))[0]
+        return _U32.unpack_from(data, pos)[0], pos + 4
     else:
         raise BorderlandsError("Unsupported wire type " + str(wire_type))
 
 
+def read_protobuf_value(b: io.BytesIO, wire_type: int) -> Any:
+    with b.getbuffer() as buf:
+        value, pos = _read_protobuf_value(buf, b.tell(), wire_type)
+        if wire_type == 2:
+            value = bytes(value)
+    b.seek(pos)
+    return value
+
+
 def read_repeated_protobuf_value(data: bytes, wire_type: int) -> list:
-    b = io.BytesIO(data)
+    # Fixed-width values can be decoded in a single call
+    if wire_type == 1:
+        return list(struct.unpack(f"<{len(data) // 8}Q", data))
+    elif wire_type == 5:
+        return list(struct.unpack(f"<{len(data) // 4}I", data))
+    elif wire_type == 0:
+        return _read_packed_varints(data)
+
     values = []
-    while b.tell() < len(data):
-        values.append(read_protobuf_value(b, wire_type))
+    pos = 0
+    end_position = len(data)
+    while pos < end_position:
+        value, pos = _read_protobuf_value(data, pos, wire_type)
+        values.append(value)
     return values
 
 
-def write_protobuf_value(*, b: io.BytesIO, wire_type: int, value: Any) -> None:
+def write_protobuf_value(*, b: bytearray, wire_type: int, value: Any) -> None:
     if wire_type == 0:
         write_varint(b, value)
     elif wire_type == 1:
-        b.write(struct.pack("<Q", value))
+        b.extend(_U64.pack(value))
     elif wire_type == 2:
-        if isinstance(value, str):
-            value = value.encode('latin1')
-        elif isinstance(value, list):
-            value = "".join(map(chr, value)).encode('latin1')
+        if not isinstance(value, bytes):
+            if isinstance(value, str):
+                value = value.encode('latin1')
+            elif isinstance(value, list):
+                value = bytes(value)
         write_varint(b, len(value))
-        b.write(value)
+        b.extend(value)
     elif wire_type == 5:
-        b.write(struct.pack("<I", value))
+        b.extend(_U32.pack(value))
     else:
         raise BorderlandsError(f"Unsupported wire type {wire_type}")
 
 
 def write_repeated_protobuf_value(data: list, wire_type: int) -> bytes:
-    b = io.BytesIO()
+    if wire_type == 1:
+        return struct.pack(f"<{len(data)}Q", *data)
+    elif wire_type == 5:
+        return struct.pack(f"<{len(data)}I", *data)
+    elif wire_type == 0 and data and min(data) >= 0 and max(data) < 0x80:
+        # Varints below 0x80 are a single byte holding the value itself
+        return bytes(data)
+
+    b = bytearray()
     for value in data:
         write_protobuf_value(b=b, wire_type=wire_type, value=value)
-    return b.getvalue()
+    return bytes(b)
 
 
 def read_protobuf(data: bytes) -> PlayerDict:
     fields: PlayerDict = {}
+    pos = 0
     end_position = len(data)
-    bytestream = io.BytesIO(data)
-    while bytestream.tell() < end_position:
-        key = read_varint(bytestream)
+    while pos < end_position:
+        key, pos = _read_varint(data, pos)
         field_number = key >> 3
         wire_type = key & 7
-        value = read_protobuf_value(bytestream, wire_type)
+        value, pos = _read_protobuf_value(data, pos, wire_type)
         fields.setdefault(field_number, []).append([wire_type, value])
     return fields
 
 
+def read_protobuf_field(data: bytes, field_number: int) -> Any:
+    """
+    Returns the value of the first `field_number` field in `data`, or None
+    if there isn't one, without decoding any of the fields after it.
+    """
+    pos = 0
+    end_position = len(data)
+    while pos < end_position:
+        key, pos = _read_varint(data, pos)
+        value, pos = _read_protobuf_value(data, pos, key & 7)
+        if key >> 3 == field_number:
+            return value
+    return None
+
+
 def apply_structure(pb_data: PlayerDict, s: dict) -> dict:
+    return apply_compiled_structure(pb_data, compile_structure(s))
+
+
+def apply_compiled_structure(pb_data: PlayerDict, compiled: Dict[Any, tuple]) -> dict:
     fields = {}
     raw = {}
     for k, data in pb_data.items():
-        mapping = s.get(k)
+        mapping = compiled.get(k)
         if mapping is None:
             raw[k] = data
             continue
-        elif isinstance(mapping, str):
-            fields[mapping] = data[0][1]
-            continue
-        key, repeated, child_s = mapping
-        if child_s is None:
+        kind, key, repeated, child_s = mapping
+        if kind == _SCALAR:
+            fields[key] = data[0][1]
+        elif kind == _PLAIN:
             values = [d[1] for d in data]
             fields[key] = values if repeated else values[0]
-        elif isinstance(child_s, int):
+        elif kind == _PACKED:
             if repeated:
                 fields[key] = read_repeated_protobuf_value(data[0][1], child_s)
             else:
                 fields[key] = data[0][1]
-        elif isinstance(child_s, tuple):
+        elif kind == _WRAPPED:
             values = [child_s[0](d[1]) for d in data]
             fields[key] = values if repeated else values[0]
-        elif isinstance(child_s, dict):
-            values = [apply_structure(read_protobuf(d[1]), child_s) for d in data]
+        elif kind == _MESSAGE:
+            values = [_parse_and_apply(d[1], child_s) for d in data]
             fields[key] = values if repeated else values[0]
         else:
-            raise TypeError(f"Wrong type of child_s: {type(child_s)}. Invalid mapping {mapping!r} for {k!r}: {data!r}")
+            raise TypeError(
+                f"Wrong type of child_s: {type(child_s)}. Invalid mapping {(key, repeated, child_s)!r} for {k!r}: {data!r}"
+            )
     if len(raw) != 0:
-        fields["_raw"] = {}
-        for k, values in raw.items():
-            safe_values = []
-            for wire_type, v in values:
-                if wire_type == 2:
-                    v = list(v)
-                safe_values.append([wire_type, v])
-            fields["_raw"][k] = safe_values
+        fields["_raw"] = _safe_raw_fields(raw)
+    return fields
+
+
+def _safe_raw_fields(raw: PlayerDict) -> dict:
+    # Binary values are stored as lists of ints, so they survive a trip
+    # through JSON
+    safe_raw = {}
+    for k, values in raw.items():
+        safe_values = []
+        for wire_type, v in values:
+            if wire_type == 2:
+                v = list(v)
+            safe_values.append([wire_type, v])
+        safe_raw[k] = safe_values
+    return safe_raw
+
+
+def _parse_and_apply(data: bytes, compiled: Dict[Any, tuple]) -> dict:
+    """
+    Same as `apply_structure(read_protobuf(data), s)` for the structure
+    `compiled` was compiled from, but values for fields known to it are
+    collected directly rather than as `[wire_type, value]` pairs which
+    would immediately be thrown away.
+    """
+    # Values of the fields known to `compiled`, and [wire_type, value] pairs for
+    # any others, both in order of first appearance like read_protobuf
+    known: Dict[int, list] = {}
+    raw: Dict[int, list] = {}
+    pos = 0
+    end_position = len(data)
+    while pos < end_position:
+        key, pos = _read_varint(data, pos)
+        field_number = key >> 3
+        wire_type = key & 7
+        value, pos = _read_protobuf_value(data, pos, wire_type)
+        if field_number in compiled:
+            values = known.get(field_number)
+            if values is None:
+                known[field_number] = [value]
+            else:
+                values.append(value)
+        else:
+            raw.setdefault(field_number, []).append([wire_type, value])
+
+    fields = {}
+    for k, values in known.items():
+        kind, key, repeated, child_s = compiled[k]
+        if kind == _SCALAR:
+            fields[key] = values[0]
+        elif kind == _PLAIN:
+            fields[key] = values if repeated else values[0]
+        elif kind == _PACKED:
+            if repeated:
+                fields[key] = read_repeated_protobuf_value(values[0], child_s)
+            else:
+                fields[key] = values[0]
+        elif kind == _WRAPPED:
+            values = [child_s[0](v) for v in values]
+            fields[key] = values if repeated else values[0]
+        elif kind == _MESSAGE:
+            values = [_parse_and_apply(v, child_s) for v in values]
+            fields[key] = values if repeated else values[0]
+        else:
+            raise TypeError(
+                f"Wrong type of child_s: {type(child_s)}. Invalid mapping {(key, repeated, child_s)!r} for {k!r}: {values!r}"
+            )
+    if len(raw) != 0:
+        fields["_raw"] = _safe_raw_fields(raw)
     return fields
 
 
 def write_protobuf(data: dict) -> bytes:
-    b = io.BytesIO()
-    # If the data came from a JSON file the keys will all be strings
-    data = {int(k): v for k, v in data.items()}
+    b = bytearray()
+    write_protobuf_into(b, data)
+    return bytes(b)
+
+
+def write_protobuf_into(b: bytearray, data: dict) -> None:
+    """
+    Serializes `data` onto the end of `b`.
+    """
+    # If the data came from a JSON file the keys will be strings (possibly
+    # mixed with ints, from remove_structure), otherwise they're already ints
+    if not all(type(k) is int for k in data):
+        data = {int(k): v for k, v in data.items()}
     for key, entries in sorted(data.items()):
         for wire_type, value in entries:
             if isinstance(value, dict):
                 value = write_protobuf(value)
                 wire_type = 2
             elif isinstance(value, (list, tuple)) and wire_type != 2:
-                sub_b = io.BytesIO()
+                sub_b = bytearray()
                 for v in value:
                     write_protobuf_value(b=sub_b, wire_type=wire_type, value=v)
-                value = sub_b.getvalue()
+                value = bytes(sub_b)
                 wire_type = 2
             write_varint(b, (key << 3) | wire_type)
             write_protobuf_value(b=b, wire_type=wire_type, value=value)
-    return b.getvalue()
@@ -1,21 +1,22 @@
 import argparse
 import base64
 import binascii
+import bisect
 import dataclasses
 import hashlib
-import io
 import json
 import math
 import os
 import random
+import re
 import struct
 import sys
-from typing import List, Tuple, Dict, Any, Optional, IO, Union
+from typing import List, Tuple, Dict, Any, Optional, IO, Union, Final
 
 from borderlands.challenges import Challenge, unwrap_challenges, wrap_challenges
 from borderlands.config import parse_args
 from borderlands.datautil.bitstreams import ReadBitstream, WriteBitstream
-from borderlands.datautil.common import conv_binary_to_str, rotate_data_right, xor_data, create_body
+from borderlands.datautil.common import bytes_to_latin1, rotate_data_right, xor_data, create_body
 from borderlands.datautil.common import invert_structure, replace_raw_item_key
 from borderlands.datautil.data_types import PlayerDict
 from borderlands.datautil.errors import BorderlandsError
@@ -29,15 +30,120 @@ from borderlands.datautil.huffman import (
 )
 from borderlands.datautil.lzo1x import lzo1x_decompress, lzo1x_1_compress
 from borderlands.datautil.protobuf import (
-    read_protobuf_value,
     read_repeated_protobuf_value,
     write_repeated_protobuf_value,
     read_protobuf,
-    apply_structure,
+    read_protobuf_field,
+    apply_compiled_structure,
+    compile_structure,
     write_protobuf,
-    remove_structure,
+    remove_compiled_structure,
+    write_varint,
 )
 
+try:
+    # python-isal's SIMD crc32 is a drop-in, much faster replacement for
+    # the zlib one on save-sized payloads
+    from isal.isal_zlib import crc32
+except ImportError:
+    from binascii import crc32
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_ITEM_HEADER: Final = struct.Struct(">Bi")
+_SAVE_HEADER: Final = struct.Struct(">I3sI")
+_WSG_HEADER: Final = struct.Struct(">I3s")
+# The rest of the WSG header (version, crc, size), keyed by endian
+_WSG_FIELDS: Final = {endian: struct.Struct(endian + "III") for endian in '<>'}
+_WSG_CRC_SIZE: Final = {endian: struct.Struct(endian + "II") for endian in '<>'}
+
+
+def _strip_bom(data: Union[str, bytes]) -> Union[str, bytes]:
+    """
+    Removes the byte order mark some Windows editors put at the start of
+    UTF-8 text files.
+    """
+    if isinstance(data, bytes):
+        if data.startswith(b'\xef\xbb\xbf'):
+            return data[3:]
+    elif data.startswith('\ufeff'):
+        return data[1:]
+    return data
+
+
+def _json_loads(data: Union[str, bytes]) -> Any:
+    # orjson doesn't accept a byte order mark, and json only does for bytes
+    data = _strip_bom(data)
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # orjson doesn't read the NaN/Infinity json writes; json will,
+            # and otherwise it raises the same error anyway
+            pass
+    return json.loads(data)
+
+
+def _sort_keys(value: Any) -> Any:
+    """
+    Returns `value` with the keys of every dict in it sorted, as json's
+    sort_keys does.  orjson's OPT_SORT_KEYS sorts integer keys as strings
+    (so field 10 would come before field 2), so this is done by hand.
+    """
+    value_type = type(value)
+    if value_type is dict:
+        return {k: _sort_keys(value[k]) for k in sorted(value)}
+    elif value_type is list:
+        return [_sort_keys(v) if type(v) in (dict, list) else v for v in value]
+    return value
+
+
+def _has_non_finite_floats(value: Any) -> bool:
+    """
+    Whether `value` contains a NaN or infinite float anywhere.  json writes
+    those as NaN/Infinity, which it reads back, but orjson writes them as
+    null, which doesn't.
+    """
+    value_type = type(value)
+    if value_type is float:
+        return not math.isfinite(value)
+    elif value_type is dict:
+        return any(_has_non_finite_floats(v) for v in value.values())
+    elif value_type is list:
+        return any(_has_non_finite_floats(v) for v in value)
+    return False
+
+
+def _json_dumps(data: Any) -> bytes:
+    if orjson is not None and not _has_non_finite_floats(data):
+        return orjson.dumps(
+            _sort_keys(data),
+            default=bytes_to_latin1,
+            option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS,
+        )
+    return json.dumps(data, default=bytes_to_latin1, sort_keys=True, indent=4).encode('utf-8')
+
+
+def _ignore_message(message: str) -> None:
+    pass
+
+
+def _notice_to_stderr(message: str) -> None:
+    print(message, file=sys.stderr)
+
+
+# The characters str.splitlines() breaks lines on, for use in a regex
+# character class
+_LINE_BREAKS: Final = r'\n\r\v\f\x1c-\x1e\x85\u2028\u2029'
+
+# The fields after the item data in imported items and weapons, already
+# encoded since they're the same for every import
+_IMPORTED_ITEM_FIELDS: Final = write_protobuf({2: [[0, 1]], 3: [[0, 0]], 4: [[0, 1]]})
+_IMPORTED_WEAPON_FIELDS: Final = write_protobuf({2: [[0, 0]], 3: [[0, 1]]})
+
 
 @dataclasses.dataclass(frozen=True)
 class InputFileData:
@@ -46,6 +152,21 @@ class InputFileData:
     close: bool
 
 
+@dataclasses.dataclass
+class ParsedItem:
+    """
+    An item or weapon from the player protobuf, parsed.  The item body
+    itself is only unwrapped when asked for, by BaseApp.unwrap_parsed_item.
+    """
+
+    field: list  # The [wire_type, data] entry this was read from
+    data: PlayerDict  # Its parsed protobuf
+    is_weapon: Optional[int] = None
+    values: Optional[List[Optional[int]]] = None
+    key: Optional[int] = None
+    dirty: bool = False  # Whether "data" needs writing back into "field"
+
+
 class BaseApp:
     """
     Base application class.
@@ -125,7 +246,7 @@ class BaseApp:
     # shenanigans to even have a prayer of it, and even then it's tricky
     # and might even require custom C extensions.  Anyway, I feel quite good
     # about these hardcodes.  Not worth the trouble in here, for sure.
-    required_xp = [
+    required_xp = (
         0,  # lvl 1
         358,  # lvl 2
         1241,  # lvl 3
@@ -206,7 +327,14 @@ class BaseApp:
         11912801,  # lvl 78
         12345393,  # lvl 79
         12787955,  # lvl 80
-    ]
+    )
+
+    @classmethod
+    def level_for_xp(cls, xp: int) -> int:
+        """
+        The character level that an XP total falls within.
+        """
+        return bisect.bisect_right(cls.required_xp, xp)
 
     def __init__(
         self,
@@ -229,6 +357,15 @@ class BaseApp:
         # Item export/import prefix
         self.item_prefix = item_prefix
 
+        # Matches the lines of an item import file which matter: section
+        # headers (group 1) and item codes (group 2).  Lines are split on
+        # the same separators as str.splitlines(), not just on newlines.
+        self.item_import_re = re.compile(
+            rf'(?:^|(?<=[{_LINE_BREAKS}]))[^\S{_LINE_BREAKS}]*'
+            rf'(?:;[^\S{_LINE_BREAKS}]*(?i:(bank|items|weapons))|{re.escape(item_prefix)}\(([^{_LINE_BREAKS}]*)\))'
+            rf'[^\S{_LINE_BREAKS}]*(?=[{_LINE_BREAKS}]|\Z)'
+        )
+
         # The only difference here is that BLTPS has "laser"
         self.black_market_keys = black_market_keys
 
@@ -237,6 +374,11 @@ class BaseApp:
         # easily, but we may as well just store it.
         self.black_market_ammo = black_market_ammo
 
+        # Positions of those ammo-related keys in the black market list
+        self.black_market_ammo_indices = tuple(
+            idx for idx, key in enumerate(black_market_keys) if key in black_market_ammo
+        )
+
         # There are two possible ways of uniquely identifying challenges in this file:
         # via their numeric position in the list, or by what looks like an internal
         # ID (though that ID is constructed a little weirdly, so I'm not sure if it's
@@ -257,6 +399,8 @@ class BaseApp:
         #
         # New major DLC for TPS seems unlikely too, though time will tell.
         self.challenges = challenges
+        # ...and in name order, for when we need to add any to a save
+        self.sorted_challenges = tuple(sorted(challenges.values()))
 
         # Set up a reverse lookup for our ammo pools
         self.ammo_resource_lookup = {}
@@ -276,32 +420,80 @@ class BaseApp:
             max_bank_size=self.max_bank_size,
             unlock_choices=unlock_choices,
         )
+        # When quiet, debug() is replaced outright, rather than checking the
+        # config on each call
+        if not self.config.verbose:
+            self.debug = _ignore_message
+        # When the output itself goes to stdout, messages (and debug(), which
+        # goes through notice()) have to keep out of its way
+        if self.config.output_filename == '-':
+            self.notice = _notice_to_stderr
 
         # Sets up our main save_structure var which controls how we read the file
-        # This is implemented in AppBL2 and AppBLTPS
+        # This is implemented in AppBL2 and AppBLTPS.  It's created for each
+        # instance, since it refers to this app's own wrap/unwrap methods.
         self.save_structure = self.create_save_structure()
 
+        # The inverted structures used when converting back to protobuf: the
+        # whole save, and each sub-message structure keyed by field number.
+        # The sub-message ones are already part of the inverted save structure.
+        self.inverted_save_structure = invert_structure(self.save_structure)
+        self.inverted_sub_structures: Dict[int, dict] = {
+            k: self.inverted_save_structure[v[0]][2]
+            for k, v in self.save_structure.items()
+            if isinstance(v, tuple) and isinstance(v[2], dict)
+        }
+
+        # ...and all of those compiled for apply/remove_compiled_structure,
+        # so that's only done once for this app.  Compiled sub-structures
+        # are the last element of their parent's compiled mapping.
+        self.compiled_save_structure = compile_structure(self.save_structure)
+        self.compiled_inverted_save_structure = compile_structure(self.inverted_save_structure)
+        self.compiled_sub_structures: Dict[int, dict] = {
+            k: self.compiled_save_structure[k][3] for k in self.inverted_sub_structures
+        }
+        self.compiled_inverted_sub_structures: Dict[int, dict] = {
+            k: self.compiled_inverted_save_structure[v[0]][3]
+            for k, v in self.save_structure.items()
+            if k in self.inverted_sub_structures
+        }
+
+        # The last (save data, unwrapped player data) pair we've seen, and
+        # the last (save data, protobuf) pair that modify_save parsed without
+        # changing anything, so the same save isn't decoded more than once.
+        # Both are matched on the identity of the save data.
+        self._unwrapped: Optional[Tuple[bytes, bytes]] = None
+        self._parsed: Optional[Tuple[bytes, PlayerDict]] = None
+
+        # Items parsed during modify_save, keyed by (field number, index),
+        # so the several passes over them only parse each one once
+        self._parsed_items: Dict[Tuple[int, int], ParsedItem] = {}
+
+        # Sub-messages of the player protobuf decoded for editing during
+        # modify_save, keyed by field number
+        self._submessages: Dict[int, PlayerDict] = {}
+        # Decoded black market (SDU) levels, see edit_black_market
+        self._black_market: Optional[List[int]] = None
+        # Unwrapped challenge data from player[15], see edit_challenges
+        self._challenge_data: Optional[dict] = None
+
     def pack_item_values(self, is_weapon: int, values: list) -> bytes:
+        # Values are packed LSB-first into a single int, with any unused
+        # bits of the last byte set
         i = 0
-        item_bytes = bytearray(32)
+        packed = 0
         for value, size in zip(values, self.item_sizes[is_weapon]):
             if value is None:
                 break
-            j = i >> 3
-            value = value << (i & 7)
-            while value != 0:
-                item_bytes[j] |= value & 0xFF
-                value = value >> 8
-                j = j + 1
+            packed |= value << i
             i = i + size
-        if (i & 7) != 0:
-            value = 0xFF << (i & 7)
-            item_bytes[i >> 3] |= value & 0xFF
-        return bytes(item_bytes[: (i + 7) >> 3])
+        packed |= -1 << i
+        length = (i + 7) >> 3
+        return (packed & ((1 << (length << 3)) - 1)).to_bytes(length, 'little')
 
     def unpack_item_values(self, is_weapon: int, data: bytes) -> List[Optional[int]]:
-        i = 8
-        data = b' ' + data
+        i = 0
+        packed = int.from_bytes(data, 'little')
         end = len(data) * 8
         result: List[Optional[int]] = []
         for size in self.item_sizes[is_weapon]:
@@ -309,24 +501,110 @@ class BaseApp:
             if j > end:
                 result.append(None)
                 continue
-            value = 0
-            for b in data[j >> 3 : (i >> 3) - 1 : -1]:
-                value = (value << 8) | b
-            result.append((value >> (i & 7)) & ~(0xFF << size))
+            result.append((packed >> i) & ((1 << size) - 1))
             i = j
         return result
 
     def wrap_item(self, *, is_weapon: int, values: list, key: int) -> bytes:
         item = self.pack_item_values(is_weapon, values)
-        header = struct.pack(">Bi", (is_weapon << 7) | self.item_struct_version, key)
+        header = _ITEM_HEADER.pack((is_weapon << 7) | self.item_struct_version, key)
         return header + create_body(item=item, header=header, key=key)
 
+    @staticmethod
+    def is_dlc_data_item(item: List[Optional[int]]) -> bool:
+        """
+        Whether unwrapped item values are one of the "fake" items which
+        hold DLC data (see export_items), rather than a real item.
+        """
+        # item[0] is 255, so it can't be one of the zeroes counted here
+        return item[0] == 255 and item.count(0) == len(item) - 1
+
     def unwrap_item(self, data: bytes) -> Tuple[int, List[Optional[int]], int]:
-        version_type, key = struct.unpack(">Bi", data[:5])
+        version_type, key = _ITEM_HEADER.unpack_from(data)
         is_weapon = version_type >> 7
         raw = rotate_data_right(xor_data(data[5:], key >> 5), key & 31)
         return is_weapon, self.unpack_item_values(is_weapon, raw[2:]), key
 
+    def iter_parsed_items(self, player: PlayerDict, field_number: int):
+        """
+        Yields a ParsedItem for every entry in player[field_number], parsing
+        each one only the first time it's seen (see unwrap_parsed_item for
+        the item body).  Items marked dirty are
+        written back by store_parsed_items.
+        """
+        for i, field in enumerate(player[field_number]):
+            parsed = self._parsed_items.get((field_number, i))
+            if parsed is None:
+                parsed = ParsedItem(field=field, data=read_protobuf(field[1]))
+                self._parsed_items[(field_number, i)] = parsed
+            yield parsed
+
+    def unwrap_parsed_item(self, parsed: ParsedItem) -> List[Optional[int]]:
+        """
+        Returns the values of a ParsedItem's item body, unwrapping it the
+        first time it's asked for.
+        """
+        if parsed.values is None:
+            parsed.is_weapon, parsed.values, parsed.key = self.unwrap_item(parsed.data[1][0][1])
+        return parsed.values
+
+    def store_parsed_items(self) -> None:
+        """
+        Writes any modified items back into the player protobuf, and
+        empties the parsed item cache.
+        """
+        for parsed in self._parsed_items.values():
+            if parsed.dirty:
+                parsed.field[1] = write_protobuf(parsed.data)
+        self._parsed_items = {}
+
+    def edit_submessage(self, player: PlayerDict, field_number: int) -> PlayerDict:
+        """
+        Returns the decoded sub-message in player[field_number] for editing,
+        decoding it only the first time it's asked for.  Edits are written
+        back by store_submessages.
+        """
+        submessage = self._submessages.get(field_number)
+        if submessage is None:
+            submessage = self._submessages[field_number] = read_protobuf(player[field_number][0][1])
+        return submessage
+
+    def store_submessages(self, player: PlayerDict) -> None:
+        """
+        Encodes any sub-messages handed out by edit_submessage,
+        edit_black_market or edit_challenges back into the player
+        protobuf, and empties the cache.
+        """
+        for field_number, submessage in self._submessages.items():
+            player[field_number][0][1] = write_protobuf(submessage)
+        self._submessages = {}
+        if self._black_market is not None:
+            player[36][0][1] = write_repeated_protobuf_value(self._black_market, 0)
+            self._black_market = None
+        if self._challenge_data is not None:
+            player[15][0][1] = self.wrap_challenges(self._challenge_data)
+            self._challenge_data = None
+
+    def edit_black_market(self, player: PlayerDict) -> List[int]:
+        """
+        Returns the list of black market (SDU) levels in player[36] for
+        editing, decoding it only once per modify_save.  It's written back
+        by store_submessages.
+        """
+        if self._black_market is None:
+            self._black_market = read_repeated_protobuf_value(player[36][0][1], 0)
+        return self._black_market
+
+    def edit_challenges(self, player: PlayerDict) -> dict:
+        """
+        Returns the unwrapped challenge data in player[15] for editing,
+        unwrapping it only once per modify_save.  It's written back by
+        store_submessages.
+        """
+        if self._challenge_data is None:
+            self._challenge_data = self.unwrap_challenges(player[15][0][1])
+        return self._challenge_data
+
     def unwrap_black_market(self, value: bytes) -> dict:
         sdu_list = read_repeated_protobuf_value(value, 0)
         return dict(zip(self.black_market_keys, sdu_list))
@@ -351,22 +629,15 @@ class BaseApp:
             'level': (item[4], item[5]),  # (grade_index, game_stage)
             '_base64': base64.b64encode(value),
         }
-        for i, (k, bits) in enumerate(self.item_header_sizes[is_weapon]):
-            x = item[1 + i]
+        for (k, bits), x in zip(self.item_header_sizes[is_weapon], item[1:4]):
             if x is None:
                 sys.exit('unwrap_item_info got None instead of int')
-            lib = x >> bits
-            asset = x & ~(lib << bits)
-            data[k] = {"lib": lib, "asset": asset}
+            data[k] = {"lib": x >> bits, "asset": x & ((1 << bits) - 1)}
         bits = 10 + is_weapon
-        parts: List[Optional[Dict[str, Any]]] = []
-        for x in item[6:]:
-            if x is None:
-                parts.append(None)
-            else:
-                lib = x >> bits
-                asset = x & ~(lib << bits)
-                parts.append({"lib": lib, "asset": asset})
+        mask = (1 << bits) - 1
+        parts: List[Optional[Dict[str, Any]]] = [
+            None if x is None else {"lib": x >> bits, "asset": x & mask} for x in item[6:]
+        ]
         data["parts"] = parts
         return data
 
@@ -377,11 +648,7 @@ class BaseApp:
             parts.append((v["lib"] << bits) | v["asset"])
         parts.extend(value["level"])  # (grade_index, game_stage)
         bits = 10 + value["is_weapon"]
-        for v in value["parts"]:
-            if v is None:
-                parts.append(None)
-            else:
-                parts.append((v["lib"] << bits) | v["asset"])
+        parts.extend(None if v is None else (v["lib"] << bits) | v["asset"] for v in value["parts"])
         return self.wrap_item(is_weapon=value["is_weapon"], values=parts, key=value["key"])
 
     @staticmethod
@@ -398,59 +665,82 @@ class BaseApp:
                 "You need to use a program like Horizon or Modio to extract the SaveGame.sav file first"
             )
 
-        if data[:20] != hashlib.sha1(data[20:]).digest():
-            raise BorderlandsError("Invalid save file")
+        # Everything after the SHA1 digest, without copying it
+        with memoryview(data) as view:
+            body = view[20:]
+            if data[:20] != hashlib.sha1(body).digest():
+                raise BorderlandsError("Invalid save file")
 
-        data = lzo1x_decompress(b'\xf0' + data[20:])
-        size, wsg, version = struct.unpack('>I3sI', data[:11])
+            data = lzo1x_decompress(b'\xf0' + body)
+        size, wsg, version = _SAVE_HEADER.unpack_from(data)
         if version != 2 and version != 0x02000000:
             raise BorderlandsError(f'Unknown save version {version}')
 
-        if version == 2:
-            crc, size = struct.unpack(">II", data[11:19])
-        else:
-            crc, size = struct.unpack("<II", data[11:19])
+        crc, size = _WSG_CRC_SIZE['>' if version == 2 else '<'].unpack_from(data, 11)
 
-        bitstream = ReadBitstream(data[19:])
-        tree = read_huffman_tree(bitstream)
-        player = huffman_decompress(tree, bitstream, size)
+        # The Huffman data is read in place rather than sliced out
+        with memoryview(data) as view:
+            bitstream = ReadBitstream(view[19:])
+            tree = read_huffman_tree(bitstream)
+            player = huffman_decompress(tree, bitstream, size)
 
-        if (binascii.crc32(player) & 0xFFFFFFFF) != crc:
+        if (crc32(player) & 0xFFFFFFFF) != crc:
             raise BorderlandsError("CRC check failed")
 
         return player
 
+    def _unwrap_player(self, data: bytes) -> bytes:
+        """
+        unwrap_player_data, reusing the result for data we've already
+        unwrapped (or wrapped) ourselves.
+        """
+        if self._unwrapped is not None and self._unwrapped[0] is data:
+            return self._unwrapped[1]
+        player = self.unwrap_player_data(data)
+        self._unwrapped = (data, player)
+        return player
+
     def wrap_player_data(self, player: bytes) -> bytes:
         """
         There's one call in here which had a hard-coded endian, as with
         unwrap_player_data above, so we're leaving that hardcoded for now.
         I suspect that it's wrong to be doing so, though.
         """
-        crc = binascii.crc32(player) & 0xFFFFFFFF
+        crc = crc32(player) & 0xFFFFFFFF
 
         bitstream = WriteBitstream()
         tree = make_huffman_tree(player)
         write_huffman_tree(tree, bitstream)
         huffman_compress(invert_tree(tree), player, bitstream)
-        data = bitstream.getvalue() + b"\x00\x00\x00\x00"
+        data = bitstream.getvalue()
+        del bitstream
 
-        header = struct.pack(">I3s", len(data) + 15, b'WSG')
-        header += struct.pack(self.config.endian + "III", 2, crc, len(player))
+        header = _WSG_HEADER.pack(len(data) + 19, b'WSG')
+        header += _WSG_FIELDS[self.config.endian].pack(2, crc, len(player))
 
-        data = lzo1x_1_compress(header + data)[1:]
+        # Assemble the LZO input with a single copy of the Huffman data
+        data = lzo1x_1_compress(b''.join((header, data, b'\x00\x00\x00\x00')))
 
-        return hashlib.sha1(data).digest() + data
+        # Drop the leading 0xf0 marker without copying the compressed data
+        with memoryview(data) as view:
+            body = view[1:]
+            data = hashlib.sha1(body).digest() + body
+
+        self._unwrapped = (data, player)
+        return data
 
     def show_save_info(self, data: bytes) -> None:
         """
         Shows information from file data, based on our config object.
         "data" should be the raw data from a save file.
 
-        Note that if a user is both showing info and making changes,
-        we're parsing the protobuf twice, since modify_save also does
-        that.  Inefficiency!
+        If modify_save has already parsed this same data without making
+        any changes, its protobuf is reused rather than parsed again.
         """
-        player = read_protobuf(self.unwrap_player_data(data))
+        if self._parsed is not None and self._parsed[0] is data:
+            player = self._parsed[1]
+        else:
+            player = read_protobuf(self._unwrap_player(data))
         self._show_save_info(player)
 
     def _show_save_info(self, player: PlayerDict) -> None:
@@ -474,11 +764,9 @@ class BaseApp:
                 if player[3][0][1] != lower:
                     player[3][0][1] = lower
                     self.debug(f'   - Also updating XP to {lower}')
-            else:
-                upper = self.required_xp[self.config.level]
-                if player[3][0][1] < lower or player[3][0][1] >= upper:
-                    player[3][0][1] = lower
-                    self.debug(f'   - Also updating XP to {lower}')
+            elif self.level_for_xp(player[3][0][1]) != self.config.level:
+                player[3][0][1] = lower
+                self.debug(f'   - Also updating XP to {lower}')
             player[2] = [[0, self.config.level]]
             changed = True
         return changed
@@ -496,11 +784,7 @@ class BaseApp:
         ):
             return False
 
-        raw = player[6][0][1]
-        b = io.BytesIO(raw)
-        values = []
-        while b.tell() < len(raw):
-            values.append(read_protobuf_value(b, 0))
+        values = read_repeated_protobuf_value(player[6][0][1], 0)
         if self.config.money is not None:
             self.debug(f' - Setting available money to {self.config.money}')
             values[0] = self.config.money
@@ -531,15 +815,14 @@ class BaseApp:
             level = player[2][0][1]
             self.debug(f' - Setting all items to character level ({level})')
         for field_number in (53, 54):
-            for field in player[field_number]:
-                field_data = read_protobuf(field[1])
-                is_weapon, item, key = self.unwrap_item(field_data[1][0][1])
+            for parsed in self.iter_parsed_items(player, field_number):
+                item = self.unwrap_parsed_item(parsed)
                 item_4 = item[4]
                 if item_4 is not None:
                     if self.config.force_item_levels or item_4 > 1:
-                        item = item[:4] + [level, level] + item[6:]
-                        field_data[1][0][1] = self.wrap_item(is_weapon=is_weapon, values=item, key=key)
-                        field[1] = write_protobuf(field_data)
+                        parsed.values = item = item[:4] + [level, level] + item[6:]
+                        parsed.data[1][0][1] = self.wrap_item(is_weapon=parsed.is_weapon, values=item, key=parsed.key)
+                        parsed.dirty = True
                     else:
                         if item_4 == 1 and not seen_level_1_warning:
                             seen_level_1_warning = True
@@ -556,29 +839,24 @@ class BaseApp:
 
         # Constructing the new value ahead of time since we'll need it
         # no matter what else happens below.
-        # This little signed/unsigned dance is awful, but it lets us put the
-        # value in as the same format we got it.  So: awesome. Byte order
-        # shouldn't actually matter here so long as it's consistent.
-        new_field_data = struct.unpack(
-            '>Q', struct.pack('>q', -(4 | (max(0, min(self.config.op_level, 0x7FFFFF)) << 8)))
-        )[0]
+        # The value is stored as the unsigned 64-bit form of a negative
+        # number, so mask it down to put it in as the same format we got it.
+        new_field_data = -(4 | (max(0, min(self.config.op_level, 0x7FFFFF)) << 8)) & 0xFFFFFFFFFFFFFFFF
 
         # Now actually get on with it
         if self.config.op_level > 0:
             if player[7][0][1] < 2 and 'uvhm' not in self.config.unlock:
                 self.config.unlock['uvhm'] = True
                 self.debug('   - Also unlocking UVHM mode')
-        for field in player[53]:
-            field_data = read_protobuf(field[1])
+        for parsed in self.iter_parsed_items(player, 53):
+            field_data = parsed.data
             if 2 in field_data:
-                is_weapon, item, key = self.unwrap_item(field_data[1][0][1])
-                # TODO: refactor condition below to function
-                if item[0] == 255 and all([val == 0 for val in item[1:]]):
+                if self.is_dlc_data_item(self.unwrap_parsed_item(parsed)):
                     idnum = (-field_data[2][0][1]) & 0xFF
                     # An ID of 4 is the one we're after
                     if idnum == 4:
                         field_data[2][0][1] = new_field_data
-                        field[1] = write_protobuf(field_data)
+                        parsed.dirty = True
                         set_op_level = True
                         break
         if not set_op_level:
@@ -613,12 +891,16 @@ class BaseApp:
         new_size = self.min_backpack_size + (sdu_size * 3)
         if size != new_size:
             self.debug(f'   - Resetting backpack size to {new_size} to match SDU count')
-        slots = read_protobuf(player[13][0][1])
-        slots[1][0][1] = new_size
-        player[13][0][1] = write_protobuf(slots)
-        s = read_repeated_protobuf_value(player[36][0][1], 0)
-        player[36][0][1] = write_repeated_protobuf_value(s[:7] + [sdu_size] + s[8:], 0)
-        return True
+        changed = False
+        slots = self.edit_submessage(player, 13)
+        if slots[1][0][1] != new_size:
+            slots[1][0][1] = new_size
+            changed = True
+        s = self.edit_black_market(player)
+        if len(s) < 8 or s[7] != sdu_size:
+            s[7:8] = [sdu_size]
+            changed = True
+        return changed
 
     def _set_bank(self, player: PlayerDict) -> bool:
         if self.config.bank is None:
@@ -631,15 +913,21 @@ class BaseApp:
         new_size = self.min_bank_size + (sdu_size * 2)
         if size != new_size:
             self.debug(f'   - Resetting bank size to {new_size} to match SDU count')
-        if 56 in player:
-            player[56][0][1] = new_size
-        else:
+        changed = False
+        if 56 not in player:
             player[56] = [[0, new_size]]
-        s = read_repeated_protobuf_value(player[36][0][1], 0)
+            changed = True
+        elif player[56][0][1] != new_size:
+            player[56][0][1] = new_size
+            changed = True
+        s = self.edit_black_market(player)
         if len(s) < 9:
-            s = s + (9 - len(s)) * [0]
-        player[36][0][1] = write_repeated_protobuf_value(s[:8] + [sdu_size] + s[9:], 0)
-        return True
+            s.extend((9 - len(s)) * [0])
+            changed = True
+        if s[8] != sdu_size:
+            s[8] = sdu_size
+            changed = True
+        return changed
 
     def _set_gun_slots(self, player: PlayerDict) -> bool:
         if self.config.gun_slots is None:
@@ -647,12 +935,15 @@ class BaseApp:
 
         self.debug(f' - Setting available gun slots to {self.config.gun_slots}')
         n = self.config.gun_slots
-        slots = read_protobuf(player[13][0][1])
-        slots[2][0][1] = n
+        changed = False
+        slots = self.edit_submessage(player, 13)
+        if slots[2][0][1] != n:
+            slots[2][0][1] = n
+            changed = True
         if slots[3][0][1] > n - 2:
             slots[3][0][1] = n - 2
-        player[13][0][1] = write_protobuf(slots)
-        return True
+            changed = True
+        return changed
 
     def _copy_nvhm_missions(self, player: PlayerDict) -> bool:
         if not self.config.copy_nvhm_missions:
@@ -670,18 +961,15 @@ class BaseApp:
         if 'slaughterdome' not in self.config.unlock:
             return False
 
-        unlocked, notifications = b'', b''
-        if 23 in player:
-            unlocked = player[23][0][1]
-        if 24 in player:
-            notifications = player[24][0][1]
+        unlocked = bytearray(player[23][0][1]) if 23 in player else bytearray()
+        notifications = bytearray(player[24][0][1]) if 24 in player else bytearray()
         self.debug(' - Unlocking Creature Slaughterdome')
         if 1 not in unlocked:
-            unlocked += b"\x01"
+            unlocked.append(1)
         if 1 not in notifications:
-            notifications += b"\x01"
-        player[23] = [[2, unlocked]]
-        player[24] = [[2, notifications]]
+            notifications.append(1)
+        player[23] = [[2, bytes(unlocked)]]
+        player[24] = [[2, bytes(notifications)]]
         return True
 
     def _unlock_tvhm_uvhm(self, player: PlayerDict) -> bool:
@@ -703,29 +991,26 @@ class BaseApp:
             return False
 
         self.debug(' - Unlocking all non-level-specific challenges')
-        challenge_unlocks = [apply_structure(read_protobuf(d[1]), self.save_structure[38][2]) for d in player[38]]
-        inverted_structure = invert_structure(self.save_structure[38][2])
-        seen_challenges = {}
-        for unlock in challenge_unlocks:
-            seen_challenges[unlock['name'].decode('latin1')] = True
-        for challenge in sorted(self.challenges.values()):
+        # Only a few fields are involved, so they're read and written
+        # directly rather than going through apply/remove_structure
+        inverted_structure = self.inverted_sub_structures[38]
+        name_field = inverted_structure['name']
+        is_from_dlc_field = inverted_structure['is_from_dlc']
+        dlc_id_field = inverted_structure['dlc_id']
+        seen_challenges = set()
+        for d in player[38]:
+            name = read_protobuf_field(d[1], name_field)
+            if name is not None:
+                seen_challenges.add(name.decode('latin1'))
+        for challenge in self.sorted_challenges:
             if challenge.id_text in seen_challenges:
                 continue
-            player[38].append(
-                [
-                    2,
-                    write_protobuf(
-                        remove_structure(
-                            {
-                                'dlc_id': challenge.category.dlc,
-                                'is_from_dlc': challenge.category.is_from_dlc,
-                                'name': challenge.id_text,
-                            },
-                            inverted_structure,
-                        )
-                    ),
-                ]
-            )
+            unlock = {
+                name_field: [[2, challenge.id_text]],
+                is_from_dlc_field: [[0, challenge.category.is_from_dlc]],
+                dlc_id_field: [[0, challenge.category.dlc]],
+            }
+            player[38].append([2, write_protobuf(unlock)])
         return True
 
     def _unlock_features(self, player: PlayerDict) -> bool:
@@ -742,11 +1027,10 @@ class BaseApp:
 
         if 'ammo' in self.config.unlock:
             self.debug(' - Unlocking ammo capacity')
-            s = read_repeated_protobuf_value(player[36][0][1], 0)
-            for idx2, (key2, _value) in enumerate(zip(self.black_market_keys, s)):
-                if key2 in self.black_market_ammo:
+            s = self.edit_black_market(player)
+            for idx2 in self.black_market_ammo_indices:
+                if idx2 < len(s):
                     s[idx2] = 7
-            player[36][0][1] = write_repeated_protobuf_value(s, 0)
             changed = True
 
         return changed
@@ -758,17 +1042,15 @@ class BaseApp:
         self.debug(' - Setting ammo pools to maximum')
 
         # First we got a figure out our black market levels
-        s = read_repeated_protobuf_value(player[36][0][1], 0)
+        s = self.edit_black_market(player)
         assert len(self.black_market_keys) == len(s)
-        bm_levels = dict(zip(self.black_market_keys, s))
 
         # Make a dict of what our max ammo is for each of our black market
         # ammo pools
         max_ammo = {}
-        for ammo_type, ammo_level in bm_levels.items():
-            if ammo_type not in self.black_market_ammo:
-                continue
-
+        for idx in self.black_market_ammo_indices:
+            ammo_type = self.black_market_keys[idx]
+            ammo_level = s[idx]
             ammo_values = self.black_market_ammo[ammo_type]
             if len(ammo_values) - 1 < ammo_level:
                 max_ammo[ammo_type] = (len(ammo_values) - 1, ammo_values[-1])
@@ -777,21 +1059,30 @@ class BaseApp:
 
         # Now loop through our 'resources' structure and modify to
         # suit, updating 'amount' and 'level' as we go.
-        inverted_structure = invert_structure(self.save_structure[11][2])
+        structure = self.compiled_sub_structures[11]
+        inverted_structure = self.compiled_inverted_sub_structures[11]
+        ammo_resource_lookup = self.ammo_resource_lookup
+        changed = False
         seen_ammo = {}
-        for idx, protobuf in enumerate(player[11]):
-            data2 = apply_structure(read_protobuf(protobuf[1]), self.save_structure[11][2])
+        for protobuf in player[11]:
+            data2 = apply_compiled_structure(read_protobuf(protobuf[1]), structure)
             resource = data2['resource'].decode('latin1')
-            if resource in self.ammo_resource_lookup:
-                ammo_type = self.ammo_resource_lookup[resource]
+            ammo_type = ammo_resource_lookup.get(resource)
+            if ammo_type is not None:
                 seen_ammo[ammo_type] = True
                 if ammo_type in max_ammo:
+                    level, amount = max_ammo[ammo_type][0], float(max_ammo[ammo_type][1])
+                    if data2['level'] == level and data2['amount'] == amount:
+                        # Already at the maximum, so no need to re-encode it
+                        continue
+
                     # Set the data in the structure
-                    data2['level'] = max_ammo[ammo_type][0]
-                    data2['amount'] = float(max_ammo[ammo_type][1])
+                    data2['level'] = level
+                    data2['amount'] = amount
 
                     # And now convert back into a protobuf
-                    player[11][idx][1] = write_protobuf(remove_structure(data2, inverted_structure))
+                    protobuf[1] = write_protobuf(remove_compiled_structure(data2, inverted_structure))
+                    changed = True
 
                 else:
                     self.error(f'Ammo type "{ammo_type}" / pool "{data2["pool"]}" not found!')
@@ -800,22 +1091,23 @@ class BaseApp:
 
         # Also, early in the game there isn't an entry in here for, for instance,
         # rocket launchers.  So let's make sure that all our known ammo exists.
-        for ammo_type in bm_levels.keys():
-            if ammo_type in self.ammo_resources.keys() and ammo_type not in seen_ammo:
+        for ammo_type in self.black_market_keys:
+            if ammo_type in self.ammo_resources and ammo_type not in seen_ammo:
                 new_struct = {
                     'resource': self.ammo_resources[ammo_type][0],
                     'pool': self.ammo_resources[ammo_type][1],
                     'level': max_ammo[ammo_type][0],
                     'amount': float(max_ammo[ammo_type][1]),
                 }
-                player[11].append([2, write_protobuf(remove_structure(new_struct, inverted_structure))])
-        return True
+                player[11].append([2, write_protobuf(remove_compiled_structure(new_struct, inverted_structure))])
+                changed = True
+        return changed
 
     def _handle_challenges(self, player: PlayerDict) -> bool:
         if not self.config.challenges:
             return False
 
-        data2 = self.unwrap_challenges(player[15][0][1])
+        data2 = self.edit_challenges(player)
         # You can specify multiple options at once.  Specifying "max" and
         # "bonus" at the same time, for instance, will put everything at its
         # max value, and then potentially lower the ones which have bonuses.
@@ -846,7 +1138,6 @@ class BaseApp:
                 if do_max or do_zero or save_challenge['total_value'] < bonus_value:
                     save_challenge['total_value'] = bonus_value
 
-        player[15][0][1] = self.wrap_challenges(data2)
         return True
 
     def _fix_challenge_overflow(self, player: PlayerDict) -> bool:
@@ -855,7 +1146,7 @@ class BaseApp:
             return False
 
         self.notice('Fix challenge overflow')
-        data2 = self.unwrap_challenges(player[15][0][1])
+        data2 = self.edit_challenges(player)
 
         for save_challenge in data2['challenges']:
             if save_challenge['id'] in self.challenges:
@@ -864,7 +1155,6 @@ class BaseApp:
                     save_challenge['total_value'] = self.challenges[save_challenge['id']].get_max() + 1
                     changed = True
 
-        player[15][0][1] = self.wrap_challenges(data2)
         return True
 
     def _set_character_name(self, player: PlayerDict) -> bool:
@@ -872,9 +1162,9 @@ class BaseApp:
             return False
 
         self.debug(f' - Setting character name to {self.config.name!r}')
-        data2 = apply_structure(read_protobuf(player[19][0][1]), self.save_structure[19][2])
+        data2 = apply_compiled_structure(read_protobuf(player[19][0][1]), self.compiled_sub_structures[19])
         data2['name'] = self.config.name
-        player[19][0][1] = write_protobuf(remove_structure(data2, invert_structure(self.save_structure[19][2])))
+        player[19][0][1] = write_protobuf(remove_compiled_structure(data2, self.compiled_inverted_sub_structures[19]))
         return True
 
     def _set_save_game_id(self, player: PlayerDict) -> bool:
@@ -890,13 +1180,13 @@ class BaseApp:
         Performs a set of modifications on file data, based on our
         config object.  "data" should be the raw data from a save
         file.
-
-        Note that if a user is both showing info and making changes,
-        we're parsing the protobuf twice, since show_save_info also does
-        that.  Inefficiency!
         """
 
-        player = read_protobuf(self.unwrap_player_data(data))
+        player = read_protobuf(self._unwrap_player(data))
+        self._parsed_items = {}
+        self._submessages = {}
+        self._black_market = None
+        self._challenge_data = None
 
         changed = False
         if self._set_level(player):
@@ -944,12 +1234,18 @@ class BaseApp:
         if self._set_save_game_id(player):
             changed = True
 
+        # The reset routines work on the encoded protobuf, so any pending
+        # edits have to be written back first
+        self.store_parsed_items()
+        self.store_submessages(player)
+
         if self._reset_challenge_or_mission(player):
             changed = True
 
         if changed:
             return self.wrap_player_data(write_protobuf(player))
         else:
+            self._parsed = (data, player)
             return data
 
     def export_items(self, data, output) -> None:
@@ -957,14 +1253,14 @@ class BaseApp:
         Exports items stored in savegame data 'data' to the open
         filehandle 'output'
         """
-        player = read_protobuf(self.unwrap_player_data(data))
+        player = read_protobuf(self._unwrap_player(data))
         skipped_count = 0
         for i, name in ((41, "Bank"), (53, "Items"), (54, "Weapons")):
             count = 0
             content = player.get(i)
             if content is None:
                 continue
-            print(f'; {name}', file=output)
+            lines = [f'; {name}']
             for field in content:
                 raw: bytes = read_protobuf(field[1])[1][0][1]
 
@@ -982,14 +1278,15 @@ class BaseApp:
                 # Gibbed.Borderlands2.FileFormats/SaveExpansion.cs for details
                 # on how to parse the `unknown2` field.
                 is_weapon, item, key = self.unwrap_item(raw)
-                if item[0] == 255 and all([val == 0 for val in item[1:]]):
+                if self.is_dlc_data_item(item):
                     skipped_count += 1
                 else:
                     count += 1
-                    raw_bytes = replace_raw_item_key(raw, 0)
-                    printable = base64.b64encode(raw_bytes).decode("latin1")
-                    code = f'{self.item_prefix}({printable})'
-                    print(code, file=output)
+                    printable = base64.b64encode(replace_raw_item_key(raw, 0)).decode("latin1")
+                    lines.append(f'{self.item_prefix}({printable})')
+            # Each section is written out in one go
+            lines.append('')
+            output.write('\n'.join(lines))
             self.debug(f' - {name} exported: {count}')
         # Don't bother reporting on skipped items, actually, since I now
         # know what they're actually used for.
@@ -1000,7 +1297,7 @@ class BaseApp:
         Reuse converting full player data to json
         for simpler code
         """
-        json_data = apply_structure(player, self.save_structure)
+        json_data = apply_compiled_structure(player, self.compiled_save_structure)
         if 'explored_areas' not in json_data:
             return []
         names = [x.decode('utf-8') for x in json_data['explored_areas']]
@@ -1038,18 +1335,26 @@ class BaseApp:
             return sys.stdin.read()
         else:
             self.debug(f'Opening {self.config.input_filename} for input file')
-            with open(self.config.input_filename, 'rb') as inp:
+            # Unbuffered, so read() sizes a single buffer from the file's
+            # stat and reads straight into it
+            with open(self.config.input_filename, 'rb', buffering=0) as inp:
                 return inp.read()
 
     def _convert_json(self, save_data: Union[str, bytes]) -> Union[str, bytes]:
         if not self.config.json:
             return save_data
 
+        # Both JSON outputs are objects, so anything else can be passed
+        # through as a savegame without trying to parse it
+        if _strip_bom(save_data).lstrip()[:1] not in ('{', b'{'):
+            self.debug('Input is not JSON, reading it as a savegame')
+            return save_data
+
         self.debug('Interpreting JSON data')
-        data = json.loads(save_data)
+        data = _json_loads(save_data)
         if '1' not in data:
             # This means the file had been output as 'json'
-            data = remove_structure(data, invert_structure(self.save_structure))
+            data = remove_compiled_structure(data, self.compiled_inverted_save_structure)
         return self.wrap_player_data(write_protobuf(data))
 
     def _import_items(self, save_data: bytes) -> Union[str, bytes]:
@@ -1061,52 +1366,54 @@ class BaseApp:
             return save_data
 
         self.debug(f'Importing items from {self.config.import_items}')
-        with open(self.config.import_items) as inp:
-            raw_items_data = inp.read()
+        # Decoded in one go rather than through a text-mode file.  It has to
+        # be UTF-8 for item_import_re to see the non-ASCII line breaks, but
+        # bytes which aren't (e.g. in comments) are escaped rather than
+        # failing the import.  item_import_re allows for \r\n endings.
+        with open(self.config.import_items, 'rb') as inp:
+            raw_items_data = inp.read().decode('utf-8', errors='surrogateescape')
 
-        player = read_protobuf(self.unwrap_player_data(save_data))
-
-        prefix_length = len(self.item_prefix) + 1
+        player = read_protobuf(self._unwrap_player(save_data))
 
         bank_count = 0
         weapon_count = 0
         item_count = 0
 
         to_bank = False
-        for line in raw_items_data.splitlines():
-            line = line.strip()
-            if line.startswith(";"):
-                name = line[1:].strip().lower()
-                if name == "bank":
-                    to_bank = True
-                elif name in ("items", "weapons"):
-                    to_bank = False
-                continue
-            elif not (line.startswith(self.item_prefix + '(') and line.endswith(')')):
+        for match in self.item_import_re.finditer(raw_items_data):
+            name, code = match.groups()
+            if name is not None:
+                to_bank = name.lower() == "bank"
                 continue
 
-            code = line[prefix_length:-1]
+            # Not validated: like b64decode, this skips characters outside the
+            # base64 alphabet, but incorrectly padded codes still raise, as do
+            # codes with non-ASCII characters in them (a plain ValueError)
             try:
-                code_bytes = base64.b64decode(code)
-            except binascii.Error:
+                code_bytes = binascii.a2b_base64(code)
+            except ValueError:
                 continue
 
-            key = random.randrange(0x100000000) - 0x80000000
+            key = random.getrandbits(32) - 0x80000000
             code_bytes = replace_raw_item_key(code_bytes, key)
+
+            # Encoded by hand: the item data as field 1, then any fixed fields
+            entry = bytearray(b'\x0a')
+            write_varint(entry, len(code_bytes))
+            entry += code_bytes
             if to_bank:
                 bank_count += 1
                 field = 41
-                entry = {1: [[2, code_bytes]]}
             elif (code_bytes[0] & 0x80) == 0:
                 item_count += 1
                 field = 53
-                entry = {1: [[2, code_bytes]], 2: [[0, 1]], 3: [[0, 0]], 4: [[0, 1]]}
+                entry += _IMPORTED_ITEM_FIELDS
             else:
                 weapon_count += 1
                 field = 54
-                entry = {1: [[2, code_bytes]], 2: [[0, 0]], 3: [[0, 1]]}
+                entry += _IMPORTED_WEAPON_FIELDS
 
-            player.setdefault(field, []).append([2, write_protobuf(entry)])
+            player.setdefault(field, []).append([2, bytes(entry)])
 
         self.debug(f' - Bank imported: {bank_count}')
         self.debug(f' - Items imported: {item_count}')
@@ -1118,11 +1425,27 @@ class BaseApp:
         self.debug('')
         outfile = self.config.output_filename
 
+        # Everything but the items list is written out as bytes
+        binary = self.config.output != 'items'
+
         if outfile == '-':
             self.debug('Using STDOUT for output file')
+            if binary:
+                # Anything already printed has to come out first
+                sys.stdout.flush()
+                return sys.stdout.buffer, False
             return sys.stdout, False
 
         self.debug(f'Use {outfile!r} for output file')
+        mode = 'wb' if binary else 'w'
+
+        # Creating the file exclusively checks that it doesn't exist yet in
+        # the same call, so there's only anything more to do if it does
+        try:
+            return open(outfile, mode.replace('w', 'x')), True
+        except FileExistsError:
+            pass
+
         if os.path.isdir(outfile):
             raise BorderlandsError(f'Output file is an existing directory: {outfile!r}')
         elif os.path.isfile(outfile):
@@ -1136,24 +1459,16 @@ class BaseApp:
                         f'Output filename {outfile!r}' + ' exists and --force not specified, aborting'
                     )
                 else:
-                    self.notice('')
-                    self.notice(f'Output filename {outfile!r} exists')
+                    self.notice(f'\nOutput filename {outfile!r} exists')
                     sys.stdout.flush()
-                    sys.stderr.flush()
                     sys.stderr.write('Continue and overwrite? [y|N] ')
                     sys.stderr.flush()
                     answer = sys.stdin.readline()
                     if answer[0].lower() == 'y':
                         os.unlink(outfile)
                     else:
-                        self.notice('')
-                        self.notice('Abort.')
+                        self.notice('\nAbort.')
                         return None
-        if self.config.output in ('savegame', 'decoded'):
-            mode = 'wb'
-        else:
-            mode = 'w'
-
         output_file = open(outfile, mode)
         return output_file, True
 
@@ -1202,14 +1517,13 @@ class BaseApp:
             self.debug('Writing savegame file')
             output_file.write(new_data)
         else:
-            player: bytes = self.unwrap_player_data(new_data)
+            player: bytes = self._unwrap_player(new_data)
             if self.config.output in ('decodedjson', 'json'):
                 self.debug('Converting to JSON for more human-readable output')
                 data = read_protobuf(player)
                 if self.config.output == 'json':
-                    data = apply_structure(data, self.save_structure)
-                player_str = json.dumps(conv_binary_to_str(data), sort_keys=True, indent=4)
-                output_file.write(player_str)
+                    data = apply_compiled_structure(data, self.compiled_save_structure)
+                output_file.write(_json_dumps(data))
             else:
                 output_file.write(player)
 
@@ -4,27 +4,30 @@ Utility for extracting skill names from html files from:
 
 Note: this is source of https://bl2skills.com/
 """
+import mmap
 import os
-import pprint
 import re
 import sys
 from typing import List, Tuple
 
 SkillItem = Tuple[str, int]
+# The markup up to the <h2> is skipped a run of non-'<' characters at a time,
+# rather than trying for a <h2> after every single character
 SKILL_PARTS_RE = re.compile(
-    r'<div class="[^"]+" data-points="[^"]+" data-max="(\d)">.+?<h2>(.+?)</h2>', re.IGNORECASE | re.DOTALL
+    rb'<div class="[^"]+" data-points="[^"]+" data-max="(\d)">[^<]*(?:<(?!h2>)[^<]*)*<h2>(.+?)</h2>',
+    re.IGNORECASE | re.DOTALL,
 )
 
 
 def extract_skills(filename: str) -> List[SkillItem]:
-    with open(filename, encoding='utf-8') as inp:
-        data = inp.read()
-
-    result: List[SkillItem] = []
-    records = SKILL_PARTS_RE.findall(data)
-    for rec in records:
-        result.append((rec[1], int(rec[0])))
-    return result
+    # Matched as bytes straight from the mapped file; only the skill names
+    # themselves need decoding
+    with open(filename, 'rb') as inp:
+        # An empty file can't be mapped
+        if os.fstat(inp.fileno()).st_size == 0:
+            return []
+        with mmap.mmap(inp.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return [(m[2].decode('utf-8'), int(m[1])) for m in SKILL_PARTS_RE.finditer(data)]
 
 
 def main() -> None:
@@ -49,8 +52,14 @@ def main() -> None:
         print('from typing import Tuple, Dict, List', file=out)
         print('', file=out)
         print('SkillItem = Tuple[str, int]', file=out)
-        print('CHARACTER_SKILLS: Final[Dict[str, List[SkillItem]]] = ', end='', file=out)
-        pprint.pprint(result, stream=out)
+        print('CHARACTER_SKILLS: Final[Dict[str, List[SkillItem]]] = {', file=out)
+        # Written out by hand, in the same layout black gives it, rather than
+        # having pprint work out line widths for every entry
+        for char_name, skills in sorted(result.items()):
+            out.write(f'    {char_name!r}: [\n')
+            out.writelines(f'        {skill!r},\n' for skill in skills)
+            out.write('    ],\n')
+        out.write('}\n')
 
 
 if __name__ == '__main__':